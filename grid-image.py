@@ -1,12 +1,32 @@
 import streamlit as st
+import PIL
 from PIL import Image, ImageDraw, ImageFont
 import io
 from streamlit_sortables import sort_items
 import hashlib
 import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, A4, landscape
 from reportlab.lib.utils import ImageReader
+import numpy as np
+
+# Optional: libvips decodes JPEGs with shrink-on-load and resizes them in a single call
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+# Pillow-SIMD is a drop-in Pillow build (pip uninstall pillow && pip install pillow-simd)
+# and reports versions like "9.5.0.post1"
+if ".post" in PIL.__version__:
+    resize_backend = "Pillow-SIMD"
+else:
+    resize_backend = "Pillow"
+if pyvips is not None:
+    resize_backend += " (libvips for JPEG)"
 
 st.title("🧱 Custom Image Grid Maker")
 
@@ -18,33 +38,41 @@ if not uploaded_files:
 # Fix for duplicate filenames - create unique identifiers
 def create_unique_id(file_obj, index):
     """Create a unique identifier for each file using hash of content + index"""
-    file_obj.seek(0)  # Reset file pointer
-    content = file_obj.read()
-    file_obj.seek(0)  # Reset again for later use
+    # UploadedFile already holds the upload in memory; getvalue() needs no seek/read
+    content = file_obj.getvalue()
     
-    # Create hash of first 1024 bytes for uniqueness
-    content_hash = hashlib.md5(content[:1024]).hexdigest()[:8]
+    # Create hash of first 4 KiB for uniqueness (non-cryptographic use); 1 KiB is often
+    # just identical EXIF header for photos from the same camera
+    content_hash = hashlib.blake2b(content[:4096], digest_size=4).hexdigest()
     base_name = os.path.splitext(file_obj.name)[0]
     extension = os.path.splitext(file_obj.name)[1]
     
-    return f"{base_name}_{content_hash}{extension}", file_obj
-
-# Create unique file mapping
-unique_files = []
-file_id_to_file = {}
-display_names = []
-
-for i, file_obj in enumerate(uploaded_files):
-    unique_id, file_ref = create_unique_id(file_obj, i)
-    unique_files.append(unique_id)
-    file_id_to_file[unique_id] = file_ref
+    return f"{base_name}_{content_hash}{extension}", content
+
+# Create unique file mapping; it only depends on the uploads, so rebuild it only when they change
+upload_key = tuple(f.file_id for f in uploaded_files)
+if st.session_state.get('upload_key') != upload_key:
+    unique_files = []
+    file_id_to_bytes = {}
+    display_names = []
+    
+    name_counts = Counter(f.name for f in uploaded_files)
+    for i, file_obj in enumerate(uploaded_files):
+        unique_id, file_bytes = create_unique_id(file_obj, i)
+        unique_files.append(unique_id)
+        file_id_to_bytes[unique_id] = file_bytes
+        
+        # Create display name (show original name + hash if duplicate exists)
+        if name_counts[file_obj.name] > 1:
+            display_names.append(f"{file_obj.name} ({unique_id.split('_')[-1].split('.')[0]})")
+        else:
+            display_names.append(file_obj.name)
     
-    # Create display name (show original name + hash if duplicate exists)
-    original_names = [f.name for f in uploaded_files]
-    if original_names.count(file_obj.name) > 1:
-        display_names.append(f"{file_obj.name} ({unique_id.split('_')[-1].split('.')[0]})")
-    else:
-        display_names.append(file_obj.name)
+    st.session_state['upload_key'] = upload_key
+    st.session_state['upload_index'] = (unique_files, file_id_to_bytes, display_names)
+
+unique_files, file_id_to_bytes, display_names = st.session_state['upload_index']
+file_id_to_name = dict(zip(unique_files, (f.name for f in uploaded_files)))
 
 # Grid setup with better defaults and validation
 st.markdown("### 📐 Grid Configuration")
@@ -61,17 +89,37 @@ if st.button(f"📏 Auto-suggest: {suggested_cols}×{suggested_rows} grid"):
     st.session_state.update({"cols": suggested_cols, "rows": suggested_rows})
     st.rerun()
 
+# Defaults for the widgets the Quick Presets write to; presets update these same keys
+for widget_key, default in {
+    "spacing_input": 2,
+    "background_type_select": "Solid Color",
+    "bg_color_picker": "#FFFFFF",
+    "bg_color1_picker": "#FFFFFF",
+    "bg_color2_picker": "#F0F0F0",
+    "preserve_transparency_check": True,
+    "add_borders_check": False,
+    "border_width_input": 2,
+    "border_color_picker": "#000000",
+    "text_color_picker": "#000000",
+}.items():
+    st.session_state.setdefault(widget_key, default)
+
 st.markdown("### 🎨 Image Sizing")
-col3, col4, col5 = st.columns(3)
-with col3:
-    resize_width = st.number_input("Width (px)", min_value=10, max_value=1000, value=256)
-with col4:
-    resize_height = st.number_input("Height (px)", min_value=10, max_value=1000, value=256)
-with col5:
-    spacing = st.number_input("Spacing (px)", min_value=0, max_value=100, value=st.session_state.get('spacing', 2), key="spacing_input")
+# Tile size and aspect changes re-decode and re-resize every tile, so apply them together
+with st.form("sizing_form", border=False):
+    col3, col4 = st.columns(2)
+    with col3:
+        resize_width = st.number_input("Width (px)", min_value=10, max_value=1000, value=256)
+    with col4:
+        resize_height = st.number_input("Height (px)", min_value=10, max_value=1000, value=256)
+    
+    # Maintain aspect ratio option
+    maintain_aspect = st.checkbox("🔒 Maintain aspect ratio", value=False, help="Keep original proportions when resizing")
+    
+    st.form_submit_button("✅ Apply Sizing")
 
-# Maintain aspect ratio option
-maintain_aspect = st.checkbox("🔒 Maintain aspect ratio", value=False, help="Keep original proportions when resizing")
+# Spacing only changes tile placement, not the tiles themselves, so it applies immediately
+spacing = st.number_input("Spacing (px)", min_value=0, max_value=100, key="spacing_input")
 
 # NEW: Background and transparency options
 st.markdown("### 🎨 Background & Transparency")
@@ -80,30 +128,29 @@ with col_bg1:
     background_type = st.selectbox(
         "Background Type",
         ["Solid Color", "Transparent", "Gradient"],
-        index=0 if 'background_type' not in st.session_state else ["Solid Color", "Transparent", "Gradient"].index(st.session_state.get('background_type', 'Solid Color')),
         help="Choose background style for your grid",
         key="background_type_select"
     )
 with col_bg2:
     if background_type == "Solid Color":
-        bg_color = st.color_picker("Background Color", value=st.session_state.get('bg_color', '#FFFFFF'), help="Grid background color", key="bg_color_picker")
+        bg_color = st.color_picker("Background Color", help="Grid background color", key="bg_color_picker")
     elif background_type == "Gradient":
-        bg_color1 = st.color_picker("Gradient Start", value=st.session_state.get('bg_color1', '#FFFFFF'), key="bg_color1_picker")
-        bg_color2 = st.color_picker("Gradient End", value=st.session_state.get('bg_color2', '#F0F0F0'), key="bg_color2_picker")
+        bg_color1 = st.color_picker("Gradient Start", key="bg_color1_picker")
+        bg_color2 = st.color_picker("Gradient End", key="bg_color2_picker")
 with col_bg3:
-    preserve_transparency = st.checkbox("🔍 Preserve image transparency", value=st.session_state.get('preserve_transparency', True), help="Keep transparent areas in uploaded images", key="preserve_transparency_check")
+    preserve_transparency = st.checkbox("🔍 Preserve image transparency", help="Keep transparent areas in uploaded images", key="preserve_transparency_check")
 
 # NEW: Border options
 st.markdown("### 🖼️ Image Borders")
 col_border1, col_border2, col_border3, col_border4 = st.columns(4)
 with col_border1:
-    add_borders = st.checkbox("Add image borders", value=st.session_state.get('add_borders', False), key="add_borders_check")
+    add_borders = st.checkbox("Add image borders", key="add_borders_check")
 with col_border2:
     if add_borders:
-        border_width = st.number_input("Border width (px)", min_value=1, max_value=20, value=st.session_state.get('border_width', 2), key="border_width_input")
+        border_width = st.number_input("Border width (px)", min_value=1, max_value=20, key="border_width_input")
 with col_border3:
     if add_borders:
-        border_color = st.color_picker("Border color", value=st.session_state.get('border_color', '#000000'), help="Color for image borders", key="border_color_picker")
+        border_color = st.color_picker("Border color", help="Color for image borders", key="border_color_picker")
 with col_border4:
     if add_borders:
         border_style = st.selectbox("Border style", ["Solid", "Dashed", "Rounded"], index=0, key="border_style_select")
@@ -119,25 +166,36 @@ with col7:
     row_font_size = st.slider("Row Label Font Size", min_value=8, max_value=64, value=16)
 with col8:
     # NEW: Text color option
-    text_color = st.color_picker("Text Color", value=st.session_state.get('text_color', '#000000'), help="Color for all text labels", key="text_color_picker")
+    text_color = st.color_picker("Text Color", help="Color for all text labels", key="text_color_picker")
 
 # Load fonts with better fallback
+@st.cache_resource(show_spinner=False)
+def find_system_font():
+    """Return the first common system font that FreeType can open, or None"""
+    for font_name in ["arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "calibri.ttf"]:
+        try:
+            ImageFont.truetype(font_name, 10)
+            return font_name
+        except OSError:
+            continue
+    return None
+
+@st.cache_resource(show_spinner=False)
+def load_font_cached(font_bytes, size):
+    """Parse a font once per (font bytes, size) and reuse it across reruns"""
+    if font_bytes is not None:
+        return ImageFont.truetype(io.BytesIO(font_bytes), size)
+    # Common system fonts are probed once per process, not once per font size
+    system_font = find_system_font()
+    if system_font is not None:
+        return ImageFont.truetype(system_font, size)
+    # Final fallback
+    return ImageFont.load_default()
+
 def load_font(font_file, size):
     """Load font with proper fallback handling"""
     try:
-        if font_file is not None:
-            font_bytes = font_file.read()
-            font_file.seek(0)  # Reset file pointer
-            return ImageFont.truetype(io.BytesIO(font_bytes), size)
-        else:
-            # Try common system fonts
-            for font_name in ["arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "calibri.ttf"]:
-                try:
-                    return ImageFont.truetype(font_name, size)
-                except:
-                    continue
-            # Final fallback
-            return ImageFont.load_default()
+        return load_font_cached(font_file.getvalue() if font_file is not None else None, size)
     except Exception as e:
         st.warning(f"⚠️ Font loading issue: {str(e)}. Using default font.")
         return ImageFont.load_default()
@@ -194,22 +252,24 @@ if show_col_labels or show_row_labels:
         row_label_pos = "Left"
         row_label_orientation = "Horizontal"
 
-# Dynamic label inputs
-if show_col_labels:
-    st.markdown("#### Column Labels")
-    col_labels = []
-    for i in range(int(cols)):
-        col_labels.append(st.text_input(f"Column {i+1}", value=f"Col {i+1}", key=f"col_label_{i}"))
-else:
-    col_labels = [""] * int(cols)
-
-if show_row_labels:
-    st.markdown("#### Row Labels")
-    row_labels = []
-    for i in range(int(rows)):
-        row_labels.append(st.text_input(f"Row {i+1}", value=f"Row {i+1}", key=f"row_label_{i}"))
-else:
-    row_labels = [""] * int(rows)
+# Dynamic label inputs, batched in a form so editing several labels re-renders the grid once
+col_labels = [""] * int(cols)
+row_labels = [""] * int(rows)
+if show_col_labels or show_row_labels:
+    with st.form("label_form", border=False):
+        if show_col_labels:
+            st.markdown("#### Column Labels")
+            col_labels = []
+            for i in range(int(cols)):
+                col_labels.append(st.text_input(f"Column {i+1}", value=f"Col {i+1}", key=f"col_label_{i}"))
+        
+        if show_row_labels:
+            st.markdown("#### Row Labels")
+            row_labels = []
+            for i in range(int(rows)):
+                row_labels.append(st.text_input(f"Row {i+1}", value=f"Row {i+1}", key=f"row_label_{i}"))
+        
+        st.form_submit_button("✅ Apply Labels")
 
 expected_count = int(rows * cols)
 available_count = len(uploaded_files)
@@ -233,12 +293,15 @@ has_row_labels = show_row_labels and any(label.strip() for label in row_labels)
 # Enhanced Image Arrangement System
 st.markdown("### 🔃 Arrange Images")
 
-# Create thumbnail previews for better visualization
-def create_thumbnail(file_obj, size=(80, 80)):
+# Create thumbnail previews for better visualization (cached so reruns don't re-decode them)
+@st.cache_data(show_spinner=False, max_entries=256)
+def create_thumbnail(file_bytes, size=(80, 80), preserve_transparency=True):
     """Create small thumbnail for preview"""
     try:
-        img = Image.open(file_obj).convert("RGBA" if preserve_transparency else "RGB")
-        img.thumbnail(size, Image.Resampling.LANCZOS)
+        img = Image.open(io.BytesIO(file_bytes))
+        img.draft("RGB", (size[0] * 2, size[1] * 2))  # JPEG shrink-on-load
+        img = img.convert("RGBA" if preserve_transparency else "RGB")
+        img.thumbnail(size, Image.Resampling.BILINEAR)  # wider kernels buy nothing visible at 60-80px
         # Create square thumbnail with white background
         thumb = Image.new("RGBA" if preserve_transparency else "RGB", size, (255, 255, 255, 255) if preserve_transparency else (255, 255, 255))
         offset = ((size[0] - img.size[0]) // 2, (size[1] - img.size[1]) // 2)
@@ -259,13 +322,15 @@ arrangement_method = st.radio(
 if arrangement_method == "🎯 Simple List (drag names)":
     # Original method - drag and drop names
     st.info("💡 Drag and drop to reorder images in the grid")
-    sorted_display_names = sort_items(display_names, direction="vertical")
+    # A stable key keeps the sortable mounted across unrelated reruns; it changes with the image set
+    order_key = "grid_order_" + hashlib.blake2b("|".join(unique_files).encode(), digest_size=4).hexdigest()
+    sorted_display_names = sort_items(display_names, direction="vertical", key=order_key)
     
     if not sorted_display_names or len(sorted_display_names) != min(expected_count, len(uploaded_files)):
         st.warning("⚠️ Please arrange all images")
         st.stop()
     
-    display_to_unique = {display_names[i]: unique_files[i] for i in range(len(display_names))}
+    display_to_unique = dict(zip(display_names, unique_files))
     sorted_unique_ids = [display_to_unique[name] for name in sorted_display_names]
 
 else:  # Manual Position Input
@@ -278,7 +343,7 @@ else:  # Manual Position Input
     for idx in range(min(expected_count, len(uploaded_files))):
         col_idx = idx % 3
         with cols_manual[col_idx]:
-            thumb = create_thumbnail(file_id_to_file[unique_files[idx]], (60, 60))
+            thumb = create_thumbnail(file_id_to_bytes[unique_files[idx]], (60, 60), preserve_transparency)
             st.image(thumb)
             position_inputs[idx] = st.number_input(
                 f"Position for {display_names[idx][:20]}...",
@@ -313,70 +378,102 @@ def hex_to_rgb(hex_color):
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
-def resize_image(img, width, height, maintain_aspect, add_border=False, border_width=0, border_color="#000000"):
+def lanczos_resize(img, size):
+    """LANCZOS resize with cheaper box-filter steps for large downscales"""
+    if img.size == tuple(size):
+        return img
+    # Exact integer downscales: a box filter is much cheaper and looks the same as LANCZOS
+    src_w, src_h = img.size
+    if src_w > size[0] and src_w % size[0] == 0 and src_h >= size[1] and src_h % size[1] == 0:
+        return img.resize(size, Image.Resampling.BOX)
+    # Box-reduce large downscales by an integer factor first so LANCZOS only covers the last ~2x
+    factor = min(img.width // (size[0] * 2), img.height // (size[1] * 2))
+    if factor > 1:
+        img = img.reduce(factor)
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+def resize_image(img, width, height, maintain_aspect, add_border=False, border_width=0, border_color="#000000", border_style="Solid", preserve_transparency=True):
     """Resize image with optional aspect ratio preservation and borders"""
-    # Convert to RGBA if preserving transparency, otherwise RGB
-    if preserve_transparency and img.mode in ('RGBA', 'LA', 'P'):
-        img = img.convert('RGBA')
-    else:
-        img = img.convert('RGB')
+    # Convert to RGBA if preserving transparency, otherwise RGB (convert() always copies, so skip no-ops)
+    target_mode = 'RGBA' if preserve_transparency and img.mode in ('RGBA', 'LA', 'P') else 'RGB'
+    if img.mode != target_mode:
+        img = img.convert(target_mode)
+    
+    # Sources already at the target ratio need no letterbox canvas; resize them directly
+    # (smaller sources still take the thumbnail path, which never upscales)
+    if maintain_aspect and img.width >= width and img.height >= height and abs(img.width / img.height - width / height) < 0.01:
+        maintain_aspect = False
+    
+    # "Dashed" has no renderer yet and, as before, leaves the tile unbordered
+    pad = border_width if add_border and border_width > 0 and border_style in ("Solid", "Rounded") else 0
+    border_rgb = hex_to_rgb(border_color) if pad else None
     
     if maintain_aspect:
         img.thumbnail((width, height), Image.Resampling.LANCZOS)
-        # Create background
-        if preserve_transparency and img.mode == 'RGBA':
-            bg = Image.new("RGBA", (width, height), (255, 255, 255, 0))
-        else:
-            bg = Image.new("RGB", (width, height), (255, 255, 255))
         offset = ((width - img.size[0]) // 2, (height - img.size[1]) // 2)
         if preserve_transparency and img.mode == 'RGBA':
+            bg = Image.new("RGBA", (width, height), (255, 255, 255, 0))
             bg.paste(img, offset, img)
+            img = bg
         else:
-            bg.paste(img, offset)
-        img = bg
+            # Opaque letterbox goes straight onto the final (bordered) canvas: one allocation
+            bg = Image.new("RGB", (width + 2 * pad, height + 2 * pad), border_rgb if pad else (255, 255, 255))
+            if pad:
+                bg.paste((255, 255, 255), (pad, pad, pad + width, pad + height))
+            bg.paste(img, (offset[0] + pad, offset[1] + pad))
+            return bg
     else:
-        img = img.resize((width, height), Image.Resampling.LANCZOS)
-    
-    # Add border if requested
-    if add_border and border_width > 0:
-        border_rgb = hex_to_rgb(border_color)
-        if border_style == "Solid":
-            # Create bordered image
-            bordered_width = width + 2 * border_width
-            bordered_height = height + 2 * border_width
-            if preserve_transparency and img.mode == 'RGBA':
-                bordered_img = Image.new("RGBA", (bordered_width, bordered_height), border_rgb + (255,))
-                bordered_img.paste(img, (border_width, border_width), img)
-            else:
-                bordered_img = Image.new("RGB", (bordered_width, bordered_height), border_rgb)
-                bordered_img.paste(img, (border_width, border_width))
-            return bordered_img
-        elif border_style == "Rounded":
-            # Create rounded border (simplified version)
-            bordered_width = width + 2 * border_width
-            bordered_height = height + 2 * border_width
-            if preserve_transparency and img.mode == 'RGBA':
-                bordered_img = Image.new("RGBA", (bordered_width, bordered_height), border_rgb + (255,))
-                bordered_img.paste(img, (border_width, border_width), img)
-            else:
-                bordered_img = Image.new("RGB", (bordered_width, bordered_height), border_rgb)
-                bordered_img.paste(img, (border_width, border_width))
-            return bordered_img
+        img = lanczos_resize(img, (width, height))
+    
+    # Add border if requested ("Rounded" is drawn the same as "Solid" for now)
+    if pad:
+        if preserve_transparency and img.mode == 'RGBA':
+            bordered_img = Image.new("RGBA", (width + 2 * pad, height + 2 * pad), border_rgb + (255,))
+            bordered_img.paste(img, (pad, pad), img)
+        else:
+            bordered_img = Image.new("RGB", (width + 2 * pad, height + 2 * pad), border_rgb)
+            bordered_img.paste(img, (pad, pad))
+        return bordered_img
     
     return img
 
-def create_rotated_text(text, font, angle=90, text_color="#000000"):
-    """Create rotated text image for vertical labels"""
-    # Get text dimensions
-    bbox = ImageDraw.Draw(Image.new("RGB", (1, 1))).textbbox((0, 0), text, font=font)
+def load_and_resize(file_bytes, width, height, maintain_aspect, add_border, border_width, border_color, border_style, preserve_transparency):
+    """Decode and resize an uploaded image"""
+    if pyvips is not None and file_bytes[:3] == b"\xff\xd8\xff":
+        # JPEG: libvips decodes at a reduced scale and resizes in one pass. Only worth it for
+        # 8-bit RGB sources that are shrunk; the header gives bands and size without decoding
+        header = pyvips.Image.new_from_buffer(file_bytes, "")
+        src_w, src_h = header.width, header.height
+        if header.bands == 3 and header.format == "uchar" and src_w >= width and src_h >= height and (src_w, src_h) != (width, height):
+            # Same exact-ratio shortcut as resize_image: those sources fill the tile, not letterbox
+            fit_inside = maintain_aspect and abs(src_w / src_h - width / height) >= 0.01
+            vips_img = pyvips.Image.thumbnail_buffer(file_bytes, width, height=height, size="down" if fit_inside else "force", no_rotate=True)
+            img = Image.fromarray(vips_img.numpy())
+            return resize_image(img, width, height, maintain_aspect, add_border, border_width, border_color, border_style, preserve_transparency)
+    img = Image.open(io.BytesIO(file_bytes))
+    # JPEGs decode straight at a reduced DCT scale (no-op for other formats); keep 2x the
+    # target so LANCZOS still has real detail to filter from
+    img.draft("RGB", (width * 2, height * 2))
+    tile = resize_image(img, width, height, maintain_aspect, add_border, border_width, border_color, border_style, preserve_transparency)
+    # A source already at tile size comes back untouched and still lazy; decode it here, in the
+    # worker thread, rather than later on the main thread when it is placed on the grid
+    tile.load()
+    return tile
+
+# Shared drawing context used only for measuring text
+measure_draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+
+def create_rotated_text(text, font, angle=90, bbox=None):
+    """Create a rotated text mask (mode "L") for vertical labels"""
+    # Get text dimensions (callers that already measured the label pass its bbox)
+    if bbox is None:
+        bbox = measure_draw.textbbox((0, 0), text, font=font)
     text_width = bbox[2] - bbox[0]
     text_height = bbox[3] - bbox[1]
     
-    # Create image with text
-    text_img = Image.new("RGBA", (text_width + 10, text_height + 10), (255, 255, 255, 0))
-    text_draw = ImageDraw.Draw(text_img)
-    text_rgb = hex_to_rgb(text_color)
-    text_draw.text((5, 5), text, fill=text_rgb + (255,), font=font)
+    # Draw the text as coverage only; the colour is applied when it is pasted onto the grid
+    text_img = Image.new("L", (text_width + 10, text_height + 10), 0)
+    ImageDraw.Draw(text_img).text((5, 5), text, fill=255, font=font)
     
     # Rotate the text image
     if angle != 0:
@@ -386,38 +483,49 @@ def create_rotated_text(text, font, angle=90, text_color="#000000"):
 
 def create_gradient_background(width, height, color1, color2, direction="vertical"):
     """Create a gradient background"""
-    gradient = Image.new("RGB", (width, height))
-    draw = ImageDraw.Draw(gradient)
+    c1 = np.array(hex_to_rgb(color1), dtype=np.float64)
+    c2 = np.array(hex_to_rgb(color2), dtype=np.float64)
     
-    r1, g1, b1 = hex_to_rgb(color1)
-    r2, g2, b2 = hex_to_rgb(color2)
+    # One colour per row (or column), then broadcast across the other axis
+    steps = height if direction == "vertical" else width
+    ratio = (np.arange(steps) / steps)[:, None]
+    ramp = (c1 * (1 - ratio) + c2 * ratio).astype(np.uint8)
     
     if direction == "vertical":
-        for y in range(height):
-            ratio = y / height
-            r = int(r1 * (1 - ratio) + r2 * ratio)
-            g = int(g1 * (1 - ratio) + g2 * ratio)
-            b = int(b1 * (1 - ratio) + b2 * ratio)
-            draw.line([(0, y), (width, y)], fill=(r, g, b))
+        gradient = np.broadcast_to(ramp[:, None, :], (height, width, 3))
     else:  # horizontal
-        for x in range(width):
-            ratio = x / width
-            r = int(r1 * (1 - ratio) + r2 * ratio)
-            g = int(g1 * (1 - ratio) + g2 * ratio)
-            b = int(b1 * (1 - ratio) + b2 * ratio)
-            draw.line([(x, 0), (x, height)], fill=(r, g, b))
+        gradient = np.broadcast_to(ramp[None, :, :], (height, width, 3))
     
-    return gradient
+    return Image.fromarray(np.ascontiguousarray(gradient), "RGB")
+
+tile_settings = (
+    resize_width, resize_height, maintain_aspect,
+    add_borders,
+    border_width if add_borders else 0,
+    border_color if add_borders else "#000000",
+    border_style if add_borders else "Solid",
+    preserve_transparency
+)
+
+def decode_tile(file_bytes):
+    """Decode and resize one grid tile using the current sizing/border settings"""
+    return load_and_resize(file_bytes, *tile_settings)
 
 try:
-    images = []
-    for unique_id in sorted_unique_ids:
-        img = Image.open(file_id_to_file[unique_id])
-        # Calculate actual dimensions including border
-        actual_width = resize_width + (2 * border_width if add_borders else 0)
-        actual_height = resize_height + (2 * border_width if add_borders else 0)
-        resized_img = resize_image(img, resize_width, resize_height, maintain_aspect, add_borders, border_width if add_borders else 0, border_color if add_borders else "#000000")
-        images.append(resized_img)
+    # Identical uploads (even under different names) are decoded once; bytes keys hash once and compare by content
+    distinct_bytes = list(dict.fromkeys(file_id_to_bytes[unique_id] for unique_id in sorted_unique_ids))
+    # Decoded tiles are kept per session for the current tile settings only, so memory is one
+    # grid's worth of tiles per session; changing the settings replaces them
+    cached_settings, cached_tiles = st.session_state.get('tile_cache', (None, {}))
+    if cached_settings != tile_settings:
+        cached_tiles = {}
+    decoded = {b: cached_tiles[b] for b in distinct_bytes if b in cached_tiles}
+    missing = [b for b in distinct_bytes if b not in decoded]
+    # Pillow releases the GIL while decoding and resampling, so tiles decode in parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        decoded.update(zip(missing, executor.map(decode_tile, missing)))
+    st.session_state['tile_cache'] = (tile_settings, decoded)
+    images = [decoded[file_id_to_bytes[unique_id]] for unique_id in sorted_unique_ids]
 except Exception as e:
     st.error(f"❌ Error processing images: {str(e)}")
     st.stop()
@@ -426,12 +534,10 @@ except Exception as e:
 with st.expander("📋 Current Arrangement Summary"):
     for idx, unique_id in enumerate(sorted_unique_ids):
         row_pos, col_pos = divmod(idx, int(cols))
-        original_name = file_id_to_file[unique_id].name
+        original_name = file_id_to_name[unique_id]
         st.text(f"Position {idx+1} (Row {row_pos+1}, Col {col_pos+1}): {original_name}")
 
 # Generate grid with enhanced background and transparency support
-draw_temp = ImageDraw.Draw(Image.new("RGB", (100, 100)))
-
 # Calculate actual image dimensions (including borders)
 actual_img_width = resize_width + (2 * border_width if add_borders else 0)
 actual_img_height = resize_height + (2 * border_width if add_borders else 0)
@@ -442,14 +548,14 @@ bottom_label_height = 0
 left_label_width = 0
 right_label_width = 0
 
+# Measure each label once; the bounding boxes are reused when drawing
+col_label_bboxes = [measure_draw.textbbox((0, 0), label, font=font_col) if label.strip() else None for label in col_labels]
+row_label_bboxes = [measure_draw.textbbox((0, 0), label, font=font_row) if label.strip() else None for label in row_labels]
+
 if has_col_labels:
-    max_height = 0
-    for label in col_labels:
-        if label.strip():
-            bbox = draw_temp.textbbox((0, 0), label, font=font_col)
-            max_height = max(max_height, bbox[3] - bbox[1])
-    
-    label_height = max_height + 15
+    # Labels are drawn at y=5 and reach down to 5 + bbox[3] (descenders included), so size the
+    # margin from bbox[3] rather than the ink height; otherwise they run into the first tile row
+    label_height = max(bbox[3] for bbox in col_label_bboxes if bbox) + 10
     if col_label_pos == "Top":
         top_label_height = label_height
     elif col_label_pos == "Bottom":
@@ -460,18 +566,10 @@ if has_col_labels:
 
 if has_row_labels:
     if row_label_orientation == "Horizontal":
-        max_width = 0
-        for label in row_labels:
-            if label.strip():
-                bbox = draw_temp.textbbox((0, 0), label, font=font_row)
-                max_width = max(max_width, bbox[2] - bbox[0])
+        max_width = max(bbox[2] - bbox[0] for bbox in row_label_bboxes if bbox)
         label_width = max_width + 15
     else:
-        max_height = 0
-        for label in row_labels:
-            if label.strip():
-                bbox = draw_temp.textbbox((0, 0), label, font=font_row)
-                max_height = max(max_height, bbox[3] - bbox[1])
+        max_height = max(bbox[3] - bbox[1] for bbox in row_label_bboxes if bbox)
         label_width = max_height + 15
     
     if row_label_pos == "Left":
@@ -486,116 +584,130 @@ if has_row_labels:
 grid_width = int(left_label_width + cols * actual_img_width + (cols - 1) * spacing + right_label_width)
 grid_height = int(top_label_height + rows * actual_img_height + (rows - 1) * spacing + bottom_label_height)
 
-# Create grid with appropriate background
+# Create grid pixel array with appropriate background
 if background_type == "Transparent":
-    grid_img = Image.new("RGBA", (grid_width, grid_height), (255, 255, 255, 0))
+    grid_array = np.full((grid_height, grid_width, 4), (255, 255, 255, 0), dtype=np.uint8)
 elif background_type == "Gradient":
-    grid_img = create_gradient_background(grid_width, grid_height, bg_color1, bg_color2)
+    grid_array = np.array(create_gradient_background(grid_width, grid_height, bg_color1, bg_color2))
 else:  # Solid Color
     bg_rgb = hex_to_rgb(bg_color)
-    grid_img = Image.new("RGB", (grid_width, grid_height), bg_rgb)
+    grid_array = np.full((grid_height, grid_width, 3), bg_rgb, dtype=np.uint8)
+
+# Tile origins per column/row, worked out once rather than per tile
+tile_xs = (int(left_label_width) + np.arange(int(cols)) * (actual_img_width + spacing)).tolist()
+tile_ys = (int(top_label_height) + np.arange(int(rows)) * (actual_img_height + spacing)).tolist()
+
+# Centering offset for an incomplete last row
+last_row_idx = int(rows) - 1
+last_row_count = len(images) - last_row_idx * int(cols)
+last_row_offset = 0
+if center_last_row and 0 < last_row_count < cols:
+    total_img_width = last_row_count * actual_img_width + (last_row_count - 1) * spacing
+    last_row_offset = int((cols * (actual_img_width + spacing) - spacing - total_img_width) / 2)
+
+# Paste images into grid
+alpha_tiles = []
+for idx, img in enumerate(images):
+    row_idx, col_idx = divmod(idx, int(cols))
+    x = tile_xs[col_idx] + (last_row_offset if row_idx == last_row_idx else 0)
+    y = tile_ys[row_idx]
+    
+    # Opaque tiles are copied straight into the canvas; tiles with alpha need compositing
+    if preserve_transparency and img.mode == 'RGBA':
+        alpha_tiles.append((img, (x, y)))
+    else:
+        tile = np.asarray(img)
+        # The pixel pipeline stays uint8 end to end; a wider dtype here would be silently truncated
+        assert tile.dtype == np.uint8, tile.dtype
+        grid_array[y:y + img.height, x:x + img.width, :3] = tile
+        if grid_array.shape[2] == 4:
+            grid_array[y:y + img.height, x:x + img.width, 3] = 255
+
+grid_img = Image.fromarray(grid_array)
+for img, position in alpha_tiles:
+    grid_img.paste(img, position, img)
 
 draw = ImageDraw.Draw(grid_img)
 text_rgb = hex_to_rgb(text_color)
 
 # Draw column labels with positioning options
 if has_col_labels:
-    for i, label in enumerate(col_labels):
-        if label.strip():
-            bbox = draw.textbbox((0, 0), label, font=font_col)
+    bottom_label_y = int(grid_height - bottom_label_height + 5)
+    for i, (label, bbox) in enumerate(zip(col_labels, col_label_bboxes)):
+        if bbox:
             text_w = bbox[2] - bbox[0]
-            x = int(left_label_width + i * (actual_img_width + spacing) + (actual_img_width - text_w) / 2)
+            x = tile_xs[i] + int((actual_img_width - text_w) / 2)
             
             # Top labels
             if col_label_pos in ["Top", "Both (Top & Bottom)"]:
-                y = 5
-                draw.text((x, y), label, fill=text_rgb, font=font_col)
+                draw.text((x, 5), label, fill=text_rgb, font=font_col)
             
             # Bottom labels
             if col_label_pos in ["Bottom", "Both (Top & Bottom)"]:
-                y = int(grid_height - bottom_label_height + 5)
-                draw.text((x, y), label, fill=text_rgb, font=font_col)
+                draw.text((x, bottom_label_y), label, fill=text_rgb, font=font_col)
 
 # Draw row labels with positioning and orientation options
 if has_row_labels:
-    for i, label in enumerate(row_labels):
-        if label.strip():
+    # Loop invariants for both orientations
+    right_label_x = int(grid_width - right_label_width + 5)
+    left_center_x = int(left_label_width / 2)
+    right_center_x = int(grid_width - right_label_width / 2)
+    text_fill = text_rgb + (255,) if grid_img.mode == 'RGBA' else text_rgb
+    rotated_labels = {}  # repeated labels (e.g. "A" on every row) are drawn and rotated once
+    for i, (label, bbox) in enumerate(zip(row_labels, row_label_bboxes)):
+        if bbox:
             if row_label_orientation == "Horizontal":
-                bbox = draw.textbbox((0, 0), label, font=font_row)
                 text_h = bbox[3] - bbox[1]
-                y = int(top_label_height + i * (actual_img_height + spacing) + (actual_img_height - text_h) / 2)
+                y = tile_ys[i] + int((actual_img_height - text_h) / 2)
                 
                 # Left labels
                 if row_label_pos in ["Left", "Both (Left & Right)"]:
-                    x = 5
-                    draw.text((x, y), label, fill=text_rgb, font=font_row)
+                    draw.text((5, y), label, fill=text_rgb, font=font_row)
                 
                 # Right labels
                 if row_label_pos in ["Right", "Both (Left & Right)"]:
-                    x = int(grid_width - right_label_width + 5)
-                    draw.text((x, y), label, fill=text_rgb, font=font_row)
+                    draw.text((right_label_x, y), label, fill=text_rgb, font=font_row)
             
             else:
-                # Vertical text (rotated)
-                rotated_text = create_rotated_text(label, font_row, 90, text_color)
-                y_center = int(top_label_height + i * (actual_img_height + spacing) + actual_img_height / 2)
+                # Vertical text (rotated), filled with the text colour straight through its mask
+                rotated_text = rotated_labels.get(label)
+                if rotated_text is None:
+                    rotated_text = rotated_labels[label] = create_rotated_text(label, font_row, 90, bbox)
+                y_center = tile_ys[i] + actual_img_height // 2
                 y = int(y_center - rotated_text.size[1] / 2)
                 
                 # Left labels
                 if row_label_pos in ["Left", "Both (Left & Right)"]:
-                    x_center = int(left_label_width / 2)
-                    x = int(x_center - rotated_text.size[0] / 2)
-                    if background_type == "Transparent":
-                        grid_img.paste(rotated_text, (x, y), rotated_text)
-                    else:
-                        temp_bg = Image.new("RGB", rotated_text.size, hex_to_rgb(bg_color) if background_type == "Solid Color" else (255, 255, 255))
-                        temp_bg.paste(rotated_text, (0, 0), rotated_text)
-                        grid_img.paste(temp_bg, (x, y))
+                    x = int(left_center_x - rotated_text.size[0] / 2)
+                    grid_img.paste(text_fill, (x, y), rotated_text)
                 
                 # Right labels
                 if row_label_pos in ["Right", "Both (Left & Right)"]:
-                    x_center = int(grid_width - right_label_width / 2)
-                    x = int(x_center - rotated_text.size[0] / 2)
-                    if background_type == "Transparent":
-                        grid_img.paste(rotated_text, (x, y), rotated_text)
-                    else:
-                        temp_bg = Image.new("RGB", rotated_text.size, hex_to_rgb(bg_color) if background_type == "Solid Color" else (255, 255, 255))
-                        temp_bg.paste(rotated_text, (0, 0), rotated_text)
-                        grid_img.paste(temp_bg, (x, y))
-
-# Paste images into grid
-for idx, img in enumerate(images):
-    row_idx, col_idx = divmod(idx, int(cols))
-
-    # Check if it's the last row and if it has fewer images
-    if center_last_row and row_idx == rows - 1:
-        remaining_images = len(images) - row_idx * cols
-        if remaining_images < cols:
-            total_img_width = remaining_images * actual_img_width + (remaining_images - 1) * spacing
-            start_x = int(left_label_width + (cols * (actual_img_width + spacing) - spacing - total_img_width) / 2)
-            x = int(start_x + col_idx * (actual_img_width + spacing))
-        else:
-            x = int(left_label_width + col_idx * (actual_img_width + spacing))
-    else:
-        x = int(left_label_width + col_idx * (actual_img_width + spacing))
-    
-    y = int(top_label_height + row_idx * (actual_img_height + spacing))
-    
-    # Paste image with transparency support
-    if preserve_transparency and img.mode == 'RGBA' and background_type == "Transparent":
-        grid_img.paste(img, (x, y), img)
-    elif preserve_transparency and img.mode == 'RGBA':
-        grid_img.paste(img, (x, y), img)
-    else:
-        grid_img.paste(img, (x, y))
+                    x = int(right_center_x - rotated_text.size[0] / 2)
+                    grid_img.paste(text_fill, (x, y), rotated_text)
 
 # Display results
 st.markdown("### 🎯 Generated Grid")
-st.image(grid_img, caption="Your Enhanced Custom Image Grid")
+# st.image encodes the full grid and then shrinks it to the page width; shrink first so big
+# grids are not encoded and decoded at full resolution just for the preview
+PREVIEW_MAX_WIDTH = 1460  # Streamlit's maximum content width (2 x 730px for high-DPI screens)
+preview_img = grid_img
+if grid_img.width > PREVIEW_MAX_WIDTH:
+    preview_height = max(1, round(grid_img.height * PREVIEW_MAX_WIDTH / grid_img.width))
+    preview_img = grid_img.resize((PREVIEW_MAX_WIDTH, preview_height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+st.image(preview_img, caption="Your Enhanced Custom Image Grid")
 
 # Enhanced download options
 st.markdown("### 📥 Download Options")
 
+def flatten_to_rgb(img):
+    """Composite an RGBA image onto white; other images are returned unchanged"""
+    if img.mode != 'RGBA':
+        return img
+    rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+    rgb_img.paste(img, mask=img.getchannel('A'))
+    return rgb_img
+
 # NEW: PDF generation function
 def create_pdf_with_grid(grid_img, filename="image_grid.pdf"):
     """Create PDF where the page size matches the image size exactly"""
@@ -605,15 +717,16 @@ def create_pdf_with_grid(grid_img, filename="image_grid.pdf"):
     from PIL import Image
     
     # Convert PIL image to format that reportlab can use
-    img_buffer = io.BytesIO()
     if grid_img.mode == 'RGBA':
-        # Convert RGBA to RGB for PDF
-        rgb_img = Image.new('RGB', grid_img.size, (255, 255, 255))
-        rgb_img.paste(grid_img, mask=grid_img.split()[-1])
-        rgb_img.save(img_buffer, format='PNG')
+        # Convert RGBA to RGB for PDF; reportlab takes the image as-is and Flate-compresses
+        # the pixels itself, so an intermediate PNG encode would only be decoded again
+        pdf_image = ImageReader(flatten_to_rgb(grid_img))
     else:
-        grid_img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
+        # Opaque grids: reportlab embeds JPEG data directly (DCTDecode) without re-encoding
+        img_buffer = io.BytesIO()
+        grid_img.save(img_buffer, format='JPEG', quality=92)
+        img_buffer.seek(0)
+        pdf_image = ImageReader(img_buffer)
     
     # Get image dimensions (pixels treated as points)
     img_width, img_height = grid_img.size
@@ -623,53 +736,48 @@ def create_pdf_with_grid(grid_img, filename="image_grid.pdf"):
     c = canvas.Canvas(pdf_buffer, pagesize=(img_width, img_height))
     
     # Draw image to exactly fill the page
-    c.drawImage(ImageReader(img_buffer), 0, 0, width=img_width, height=img_height)
+    c.drawImage(pdf_image, 0, 0, width=img_width, height=img_height)
     c.save()
     
     pdf_buffer.seek(0)
     return pdf_buffer.getvalue()
 
 
+def encode_image(img, format, **save_kwargs):
+    """Encode image to bytes, flattening transparency onto white for formats without alpha"""
+    if format in ("JPEG", "BMP"):
+        img = flatten_to_rgb(img)
+    buf = io.BytesIO()
+    img.save(buf, format=format, **save_kwargs)
+    return buf.getvalue()
+
+
+# Downloads are encoded lazily: Streamlit only calls the data callable when the button is clicked
 col10, col11, col12, col13 = st.columns(4)
 
 with col10:
     # PNG download (default)
-    buf_png = io.BytesIO()
-    if background_type == "Transparent":
-        grid_img.save(buf_png, format="PNG", optimize=True)
-    else:
-        grid_img.save(buf_png, format="PNG", optimize=True)
     st.download_button(
         "📥 Download PNG", 
-        buf_png.getvalue(), 
+        partial(encode_image, grid_img, "PNG", optimize=True), 
         file_name="image_grid.png", 
         mime="image/png"
     )
 
 with col11:
-    # JPEG download (convert RGBA to RGB for JPEG)
-    buf_jpg = io.BytesIO()
-    if grid_img.mode == 'RGBA':
-        # Convert RGBA to RGB with white background for JPEG
-        rgb_img = Image.new('RGB', grid_img.size, (255, 255, 255))
-        rgb_img.paste(grid_img, mask=grid_img.split()[-1])
-        rgb_img.save(buf_jpg, format="JPEG", quality=95, optimize=True)
-    else:
-        grid_img.save(buf_jpg, format="JPEG", quality=95, optimize=True)
+    # JPEG download (RGBA is flattened onto white)
     st.download_button(
         "📥 Download JPEG", 
-        buf_jpg.getvalue(), 
+        partial(encode_image, grid_img, "JPEG", quality=95, optimize=True, progressive=True), 
         file_name="image_grid.jpg", 
         mime="image/jpeg"
     )
 
 with col12:
     # High quality PNG
-    buf_hq = io.BytesIO()
-    grid_img.save(buf_hq, format="PNG", compress_level=1)
     st.download_button(
         "📥 Download HQ PNG", 
-        buf_hq.getvalue(), 
+        partial(encode_image, grid_img, "PNG", compress_level=1), 
         file_name="image_grid_hq.png", 
         mime="image/png"
     )
@@ -705,45 +813,27 @@ col_extra1, col_extra2, col_extra3 = st.columns(3)
 
 with col_extra1:
     # WebP format
-    buf_webp = io.BytesIO()
-    if grid_img.mode == 'RGBA':
-        grid_img.save(buf_webp, format="WebP", quality=90, method=6)
-    else:
-        grid_img.save(buf_webp, format="WebP", quality=90, method=6)
     st.download_button(
         "📥 Download WebP", 
-        buf_webp.getvalue(), 
+        partial(encode_image, grid_img, "WebP", quality=90, method=4), 
         file_name="image_grid.webp", 
         mime="image/webp"
     )
 
 with col_extra2:
     # TIFF format
-    buf_tiff = io.BytesIO()
-    if grid_img.mode == 'RGBA':
-        grid_img.save(buf_tiff, format="TIFF", compression="lzw")
-    else:
-        grid_img.save(buf_tiff, format="TIFF", compression="lzw")
     st.download_button(
         "📥 Download TIFF", 
-        buf_tiff.getvalue(), 
+        partial(encode_image, grid_img, "TIFF", compression="tiff_adobe_deflate"), 
         file_name="image_grid.tiff", 
         mime="image/tiff"
     )
 
 with col_extra3:
-    # BMP format
-    buf_bmp = io.BytesIO()
-    if grid_img.mode == 'RGBA':
-        # Convert RGBA to RGB for BMP
-        rgb_img = Image.new('RGB', grid_img.size, (255, 255, 255))
-        rgb_img.paste(grid_img, mask=grid_img.split()[-1])
-        rgb_img.save(buf_bmp, format="BMP")
-    else:
-        grid_img.save(buf_bmp, format="BMP")
+    # BMP format (RGBA is flattened onto white)
     st.download_button(
         "📥 Download BMP", 
-        buf_bmp.getvalue(), 
+        partial(encode_image, grid_img, "BMP"), 
         file_name="image_grid.bmp", 
         mime="image/bmp"
     )
@@ -760,126 +850,96 @@ info_text = f"""
 **Transparency Preserved:** {'Yes' if preserve_transparency else 'No'}  
 **Borders:** {'Yes' if add_borders else 'No'} {f'({border_width}px, {border_color})' if add_borders else ''}  
 **Text Color:** {text_color}  
-**File Size (PNG):** ~{len(buf_png.getvalue()) / 1024:.1f} KB
+**Resize Backend:** {resize_backend}  
+**Uncompressed Size:** ~{grid_width * grid_height * len(grid_img.getbands()) / 1024:.1f} KB
 """
 st.info(info_text)
 
 # NEW: Grid statistics and analysis
 with st.expander("📈 Advanced Grid Analysis"):
-    st.markdown("#### Image Format Distribution")
-    format_counts = {}
-    for unique_id in sorted_unique_ids:
-        file_obj = file_id_to_file[unique_id]
-        try:
-            with Image.open(file_obj) as img:
-                format_name = img.format or "Unknown"
-                format_counts[format_name] = format_counts.get(format_name, 0) + 1
-        except:
-            format_counts["Error"] = format_counts.get("Error", 0) + 1
-    
-    for fmt, count in format_counts.items():
-        st.text(f"{fmt}: {count} images ({count/len(sorted_unique_ids)*100:.1f}%)")
-    
-    st.markdown("#### Color Space Information")
-    color_modes = {}
-    total_pixels = 0
-    for unique_id in sorted_unique_ids:
-        file_obj = file_id_to_file[unique_id]
-        try:
-            with Image.open(file_obj) as img:
-                mode = img.mode
-                color_modes[mode] = color_modes.get(mode, 0) + 1
-                total_pixels += img.size[0] * img.size[1]
-        except:
-            color_modes["Error"] = color_modes.get("Error", 0) + 1
-    
-    for mode, count in color_modes.items():
-        st.text(f"{mode}: {count} images ({count/len(sorted_unique_ids)*100:.1f}%)")
-    
-    st.text(f"Total original pixels processed: {total_pixels:,}")
+    # The expander body runs on every rerun even while collapsed, so the per-image pass is opt-in
+    if st.checkbox("Compute analysis", value=False, key="run_analysis"):
+        # One header parse per image feeds both tallies (Image.open reads no pixel data)
+        formats = []
+        modes = []
+        total_pixels = 0
+        for unique_id in sorted_unique_ids:
+            try:
+                with Image.open(io.BytesIO(file_id_to_bytes[unique_id])) as img:
+                    formats.append(img.format or "Unknown")
+                    modes.append(img.mode)
+                    total_pixels += img.size[0] * img.size[1]
+            except (OSError, ValueError, Image.DecompressionBombError):  # UnidentifiedImageError is an OSError
+                formats.append("Error")
+                modes.append("Error")
+        format_counts = Counter(formats)
+        color_modes = Counter(modes)
+        pct_per_image = 100.0 / max(len(sorted_unique_ids), 1)
+        
+        st.markdown("#### Image Format Distribution")
+        for fmt, count in format_counts.items():
+            st.text(f"{fmt}: {count} images ({count * pct_per_image:.1f}%)")
+        
+        st.markdown("#### Color Space Information")
+        for mode, count in color_modes.items():
+            st.text(f"{mode}: {count} images ({count * pct_per_image:.1f}%)")
+        
+        st.text(f"Total original pixels processed: {total_pixels:,}")
     st.text(f"Final grid pixels: {grid_width * grid_height:,}")
 
 # NEW: Quick presets for common configurations
 st.markdown("### ⚡ Quick Presets")
 col_preset1, col_preset2, col_preset3, col_preset4 = st.columns(4)
 
+# Presets write straight into the widgets' keys from on_click, which runs before the next
+# rerun, so a single rerun picks them up
 with col_preset1:
-    if st.button("🎨 Art Gallery", help="White background, black borders, elegant labels"):
-        st.session_state.update({
-            'background_type': 'Solid Color',
-            'bg_color': '#FFFFFF',
-            'add_borders': True,
-            'border_width': 3,
-            'border_color': '#000000',
-            'text_color': '#000000',
-            'spacing': 10,
-            'preserve_transparency': False
-        })
-        st.rerun()
+    st.button("🎨 Art Gallery", help="White background, black borders, elegant labels", on_click=st.session_state.update, args=({
+        'background_type_select': 'Solid Color',
+        'bg_color_picker': '#FFFFFF',
+        'add_borders_check': True,
+        'border_width_input': 3,
+        'border_color_picker': '#000000',
+        'text_color_picker': '#000000',
+        'spacing_input': 10,
+        'preserve_transparency_check': False
+    },))
 
 with col_preset2:
-    if st.button("🌙 Dark Mode", help="Dark background, light borders and text"):
-        st.session_state.update({
-            'background_type': 'Solid Color',
-            'bg_color': '#2E2E2E',
-            'add_borders': True,
-            'border_width': 2,
-            'border_color': '#FFFFFF',
-            'text_color': '#FFFFFF',
-            'spacing': 5,
-            'preserve_transparency': False
-        })
-        st.rerun()
+    st.button("🌙 Dark Mode", help="Dark background, light borders and text", on_click=st.session_state.update, args=({
+        'background_type_select': 'Solid Color',
+        'bg_color_picker': '#2E2E2E',
+        'add_borders_check': True,
+        'border_width_input': 2,
+        'border_color_picker': '#FFFFFF',
+        'text_color_picker': '#FFFFFF',
+        'spacing_input': 5,
+        'preserve_transparency_check': False
+    },))
 
 with col_preset3:
-    if st.button("🎭 Transparent", help="Transparent background, no borders"):
-        st.session_state.update({
-            'background_type': 'Transparent',
-            'add_borders': False,
-            'text_color': '#000000',
-            'spacing': 2,
-            'preserve_transparency': True,
-            'border_width': 2,
-            'border_color': '#000000'
-        })
-        st.rerun()
+    st.button("🎭 Transparent", help="Transparent background, no borders", on_click=st.session_state.update, args=({
+        'background_type_select': 'Transparent',
+        'add_borders_check': False,
+        'text_color_picker': '#000000',
+        'spacing_input': 2,
+        'preserve_transparency_check': True,
+        'border_width_input': 2,
+        'border_color_picker': '#000000'
+    },))
 
 with col_preset4:
-    if st.button("🌈 Gradient", help="Gradient background with colorful borders"):
-        st.session_state.update({
-            'background_type': 'Gradient',
-            'bg_color1': '#FFE5E5',
-            'bg_color2': '#E5F3FF',
-            'add_borders': True,
-            'border_width': 2,
-            'border_color': '#FF6B6B',
-            'text_color': '#2C3E50',
-            'spacing': 8,
-            'preserve_transparency': False
-        })
-        st.rerun()
-
-# Update variables after potential preset changes
-if 'background_type' in st.session_state:
-    background_type = st.session_state['background_type']
-if 'bg_color' in st.session_state:
-    bg_color = st.session_state['bg_color']
-if 'bg_color1' in st.session_state and background_type == "Gradient":
-    bg_color1 = st.session_state['bg_color1']
-if 'bg_color2' in st.session_state and background_type == "Gradient":
-    bg_color2 = st.session_state['bg_color2']
-if 'add_borders' in st.session_state:
-    add_borders = st.session_state['add_borders']
-if 'border_width' in st.session_state:
-    border_width = st.session_state['border_width']
-if 'border_color' in st.session_state:
-    border_color = st.session_state['border_color']
-if 'text_color' in st.session_state:
-    text_color = st.session_state['text_color']
-if 'spacing' in st.session_state:
-    spacing = st.session_state['spacing']
-if 'preserve_transparency' in st.session_state:
-    preserve_transparency = st.session_state['preserve_transparency']
+    st.button("🌈 Gradient", help="Gradient background with colorful borders", on_click=st.session_state.update, args=({
+        'background_type_select': 'Gradient',
+        'bg_color1_picker': '#FFE5E5',
+        'bg_color2_picker': '#E5F3FF',
+        'add_borders_check': True,
+        'border_width_input': 2,
+        'border_color_picker': '#FF6B6B',
+        'text_color_picker': '#2C3E50',
+        'spacing_input': 8,
+        'preserve_transparency_check': False
+    },))
 
 st.markdown("### 💡 Tips & Tricks")
 with st.expander("Click to see helpful tips"):